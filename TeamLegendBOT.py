@@ -1,11 +1,22 @@
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
+import asyncio
+import bisect
+import contextvars
+import itertools
 import json
 import os
+import pickle
+import signal
+import time
+import unicodedata
 import urllib.parse
 import requests
 from dotenv import load_dotenv
 
+from leaderboard_index import LeaderboardIndex
+
 # Load .env variables
 load_dotenv()
 
@@ -17,6 +28,11 @@ BOT_TOKEN = os.getenv("DISCORD_TOKEN")  # <- Match exactly what Render expects
 LINK_FILE = 'linked_clans.json'
 PROFILE_FILE = 'linked_profiles.json'
 MAIL_CHANNEL_FILE = 'mail_channel.json'
+ROSTER_CHANNEL_FILE = 'roster_channel.json'
+COC_CACHE_FILE = 'coc_cache.pickle'
+TRACE_EXPORT_FILE = 'traces.json'
+
+HOME_CLAN_TAG = "2L80RLGJ8"  # Team Legend clan tag WITHOUT #
 
 intents = discord.Intents.all()
 intents.message_content = True
@@ -37,8 +53,7 @@ async def get_mail_channel(bot):
     if not os.path.exists(MAIL_CHANNEL_FILE):
         return None
     try:
-        with open(MAIL_CHANNEL_FILE, 'r') as f:
-            data = json.load(f)
+        data = load_json(MAIL_CHANNEL_FILE)
         channel_id = data.get("channel_id")
         if channel_id is None:
             return None
@@ -52,11 +67,633 @@ def is_valid_tag(tag: str) -> bool:
     return len(tag) > 0 and all(c in valid_chars for c in tag)
 
 # Initialize JSON files if they do not exist
-for file in [LINK_FILE, PROFILE_FILE, MAIL_CHANNEL_FILE]:
+for file in [LINK_FILE, PROFILE_FILE, MAIL_CHANNEL_FILE, ROSTER_CHANNEL_FILE]:
     if not os.path.exists(file):
         with open(file, 'w') as f:
             json.dump({}, f)
 
+# ------------------------------
+# 🧭 Command Tracing — fixed-size ring of recent command timings
+# ------------------------------
+
+TRACE_RING_SIZE = 512
+
+class TraceSpan:
+    """One command run: total time plus time spent in the API, JSON store and Discord sends.
+
+    Spans are preallocated in trace_ring and overwritten in place, so tracing
+    allocates nothing per command.
+    """
+
+    __slots__ = ("command", "user_id", "guild_id", "started_at", "start", "total_ms", "failed",
+                 "api_ms", "api_calls", "store_ms", "store_calls", "discord_ms", "discord_calls")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.command = None
+        self.user_id = 0
+        self.guild_id = 0
+        self.started_at = 0.0
+        self.start = 0.0
+        self.total_ms = 0.0
+        self.failed = False
+        self.api_ms = self.store_ms = self.discord_ms = 0.0
+        self.api_calls = self.store_calls = self.discord_calls = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "user_id": self.user_id,
+            "guild_id": self.guild_id,
+            "started_at": self.started_at,
+            "total_ms": round(self.total_ms, 3),
+            "failed": self.failed,
+            "api": {"ms": round(self.api_ms, 3), "calls": self.api_calls},
+            "store": {"ms": round(self.store_ms, 3), "calls": self.store_calls},
+            "discord": {"ms": round(self.discord_ms, 3), "calls": self.discord_calls},
+        }
+
+trace_ring = [TraceSpan() for _ in range(TRACE_RING_SIZE)]
+trace_cursor = 0
+# The span of the command running in the current task, if any.
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def trace_add(kind: str, started: float):
+    """Charge the time since `started` to the current command's api/store/discord sub-span."""
+    span = current_trace.get()
+    if span is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if kind == "api":
+        span.api_ms += elapsed_ms
+        span.api_calls += 1
+    elif kind == "store":
+        span.store_ms += elapsed_ms
+        span.store_calls += 1
+    else:
+        span.discord_ms += elapsed_ms
+        span.discord_calls += 1
+
+def completed_traces() -> list:
+    return [span for span in trace_ring if span.command is not None and span.start == 0.0]
+
+def load_json(path: str):
+    started = time.perf_counter()
+    with open(path, 'r') as f:
+        data = json.load(f)
+    trace_add("store", started)
+    return data
+
+def save_json(path: str, data, indent=2):
+    started = time.perf_counter()
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=indent)
+    trace_add("store", started)
+
+async def traced_send(destination, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return await destination.send(*args, **kwargs)
+    finally:
+        trace_add("discord", started)
+
+class TracedContext(commands.Context):
+    async def send(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().send(*args, **kwargs)
+        finally:
+            trace_add("discord", started)
+
+@bot.before_invoke
+async def start_trace(ctx):
+    global trace_cursor
+    span = trace_ring[trace_cursor]
+    trace_cursor = (trace_cursor + 1) % TRACE_RING_SIZE
+    span.reset()
+    span.command = ctx.command.qualified_name
+    span.user_id = ctx.author.id
+    span.guild_id = ctx.guild.id if ctx.guild else 0
+    span.started_at = time.time()
+    span.start = time.perf_counter()
+    current_trace.set(span)
+
+@bot.after_invoke
+async def finish_trace(ctx):
+    span = current_trace.get()
+    if span is None:
+        return
+    span.total_ms = (time.perf_counter() - span.start) * 1000
+    span.failed = ctx.command_failed
+    span.start = 0.0
+    current_trace.set(None)
+
+# ------------------------------
+# 🗄️ Clash of Clans API client with response cache
+# ------------------------------
+
+COC_API_BASE = "https://api.clashofclans.com/v1"
+COC_REQUEST_TIMEOUT = 10
+
+# Bounds for the response cache. Expired entries are only worth keeping for
+# ETag revalidation, and not once they are this old.
+COC_CACHE_MAX_ENTRIES = 20000
+COC_CACHE_MAX_STALE = 24 * 60 * 60
+
+coc_session = requests.Session()
+# API path -> (expires_at, etag, data). expires_at is wall-clock time so it
+# stays meaningful if the cache is ever carried across restarts. Entries are
+# kept in order of last use, oldest first.
+coc_cache = {}
+
+def coc_cache_entry_usable(entry, now: float) -> bool:
+    """Whether an entry can still be served or revalidated with its ETag."""
+    return entry[0] > now or (bool(entry[1]) and now - entry[0] < COC_CACHE_MAX_STALE)
+
+def prune_coc_cache():
+    """Drop entries past their usable life, then the least recently used ones
+    until the cache is back under COC_CACHE_MAX_ENTRIES."""
+    now = time.time()
+    for path in [path for path, entry in coc_cache.items() if not coc_cache_entry_usable(entry, now)]:
+        del coc_cache[path]
+    # Evict a tenth below the bound so a full cache is not rescanned on every insert.
+    if len(coc_cache) > COC_CACHE_MAX_ENTRIES:
+        excess = len(coc_cache) - COC_CACHE_MAX_ENTRIES * 9 // 10
+        for path in list(itertools.islice(coc_cache, excess)):
+            del coc_cache[path]
+
+def _store_coc_cache(path: str, entry):
+    # Re-insert so the dict order tracks last use.
+    coc_cache.pop(path, None)
+    coc_cache[path] = entry
+    if len(coc_cache) > COC_CACHE_MAX_ENTRIES:
+        prune_coc_cache()
+
+def _cache_max_age(response) -> int:
+    for part in response.headers.get("Cache-Control", "").split(","):
+        part = part.strip()
+        if part.startswith("max-age="):
+            try:
+                return int(part[len("max-age="):])
+            except ValueError:
+                return 0
+    return 0
+
+def _coc_fetch(path: str, etag):
+    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    return coc_session.get(f"{COC_API_BASE}{path}", headers=headers, timeout=COC_REQUEST_TIMEOUT)
+
+async def coc_get(path: str, fresh: bool = False):
+    """Fetch an API path, returning (status_code, data).
+
+    Fresh cached entries are served without a request, stale ones are
+    revalidated with If-None-Match so unchanged data costs a 304. Only 200
+    responses are cached; network errors propagate to the caller.
+    """
+    entry = coc_cache.get(path)
+    now = time.time()
+    if entry is not None and not fresh and entry[0] > now:
+        _store_coc_cache(path, entry)
+        return 200, entry[2]
+
+    started = time.perf_counter()
+    response = await asyncio.to_thread(_coc_fetch, path, entry[1] if entry else None)
+    trace_add("api", started)
+    if response.status_code == 304 and entry is not None:
+        _store_coc_cache(path, (now + _cache_max_age(response), entry[1], entry[2]))
+        return 200, entry[2]
+    if response.status_code != 200:
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"reason": response.text}
+        return response.status_code, data
+
+    data = response.json()
+    _store_coc_cache(path, (now + _cache_max_age(response), response.headers.get("ETag"), data))
+    index_response(path, data)
+    return 200, data
+
+# --- PERSISTENT CACHE (warm restarts) ---
+COC_CACHE_SAVE_MINUTES = 5
+COC_CACHE_CHUNK_SIZE = 1000
+
+def save_coc_cache(snapshot=None):
+    """Write the response cache to disk atomically, keeping original expiry times.
+
+    Entries past their usable life are dropped and only the most recently
+    used COC_CACHE_MAX_ENTRIES are kept, so stale ETags do not pile up on
+    disk. Entries are pickled in chunks, oldest first, so that loading never
+    holds the GIL for one huge unpickle.
+    """
+    if snapshot is None:
+        snapshot = dict(coc_cache)
+    now = time.time()
+    entries = [(path, entry) for path, entry in snapshot.items() if coc_cache_entry_usable(entry, now)]
+    entries = entries[-COC_CACHE_MAX_ENTRIES:]
+    tmp_file = f"{COC_CACHE_FILE}.tmp"
+    with open(tmp_file, 'wb') as f:
+        for i in range(0, len(entries), COC_CACHE_CHUNK_SIZE):
+            pickle.dump(dict(entries[i:i + COC_CACHE_CHUNK_SIZE]), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, COC_CACHE_FILE)
+
+def _read_coc_cache():
+    entries = {}
+    if not os.path.exists(COC_CACHE_FILE):
+        return entries
+    with open(COC_CACHE_FILE, 'rb') as f:
+        while True:
+            try:
+                entries.update(pickle.load(f))
+            except EOFError:
+                return entries
+
+async def load_coc_cache():
+    global name_index
+    started = time.perf_counter()
+    try:
+        entries = await asyncio.to_thread(_read_coc_cache)
+    except Exception as e:
+        print(f"⚠️ Could not load API cache: {e}")
+        return
+    # Anything fetched while the file was loading is newer; keep it, and
+    # keep it last so it is evicted last.
+    live = dict(coc_cache)
+    coc_cache.clear()
+    coc_cache.update((path, entry) for path, entry in entries.items() if path not in live)
+    coc_cache.update(live)
+    prune_coc_cache()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✅ Loaded {len(entries)} cached API responses in {elapsed_ms:.1f} ms")
+
+    # Index the restored names off the loop, then layer on top whatever was
+    # indexed live in the meantime and swap the new index in.
+    started = time.perf_counter()
+    try:
+        loaded_index = await asyncio.to_thread(build_name_index, entries)
+    except Exception as e:
+        print(f"⚠️ Could not index cached names: {e}")
+        return
+    loaded_index.add_many(name_index.items())
+    name_index = loaded_index
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✅ Indexed {len(name_index)} clan/player names in {elapsed_ms:.1f} ms")
+
+@tasks.loop(minutes=COC_CACHE_SAVE_MINUTES)
+async def coc_cache_save_loop():
+    # The first iteration runs at startup, when there is nothing new to save.
+    if coc_cache_save_loop.current_loop == 0:
+        return
+    prune_coc_cache()
+    try:
+        await asyncio.to_thread(save_coc_cache, dict(coc_cache))
+    except Exception as e:
+        print(f"⚠️ Could not save API cache: {e}")
+
+@coc_cache_save_loop.before_loop
+async def before_coc_cache_save():
+    await bot.wait_until_ready()
+    # Saving before the load has finished would overwrite the file with a partial cache.
+    await bot.coc_cache_load_task
+
+def clan_path(tag: str, suffix: str = "") -> str:
+    return f"/clans/%23{tag}{suffix}"
+
+def player_path(tag: str) -> str:
+    return f"/players/%23{tag}"
+
+# ------------------------------
+# 🔎 Name Search Index — resolve clan/player names to tags without the API
+# ------------------------------
+
+def normalize_name(name: str) -> str:
+    # NFKC folds the styled unicode letters common in Clash names into plain ones.
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+def name_trigrams(name: str) -> set:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Most names a fuzzy search will score, so autocomplete stays cheap.
+TRIGRAM_CANDIDATE_LIMIT = 1000
+
+class NameIndex:
+    """Clan and player names the bot has seen, searchable by prefix and trigram overlap.
+
+    Names are stored normalized; several tags can share one name. sorted_names
+    supports prefix scans with bisect, trigrams maps each trigram to the names
+    containing it for fuzzy matches.
+    """
+
+    def __init__(self):
+        self.entries = {}       # (kind, tag) -> normalized name
+        self.display = {}       # (kind, tag) -> name as returned by the API
+        self.by_name = {}       # normalized name -> set of (kind, tag)
+        self.sorted_names = []
+        self.trigrams = {}      # trigram -> set of normalized names
+        self.gram_counts = {}   # normalized name -> number of trigrams
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, kind: str, tag: str, name: str):
+        key = (kind, tag)
+        norm = normalize_name(name)
+        self.display[key] = name
+        old = self.entries.get(key)
+        if old == norm:
+            return
+        if old is not None:
+            self._unlink(key, old)
+        self.entries[key] = norm
+        keys = self.by_name.get(norm)
+        if keys is None:
+            keys = self.by_name[norm] = set()
+            bisect.insort(self.sorted_names, norm)
+            grams = name_trigrams(norm)
+            self.gram_counts[norm] = len(grams)
+            for gram in grams:
+                self.trigrams.setdefault(gram, set()).add(norm)
+        keys.add(key)
+
+    def add_many(self, items):
+        """Add (kind, tag, name) entries in bulk, sorting sorted_names once at the end.
+
+        Later items win over earlier ones and over what is already indexed.
+        """
+        added = []
+        removed = set()
+        for kind, tag, name in items:
+            key = (kind, tag)
+            norm = normalize_name(name)
+            self.display[key] = name
+            old = self.entries.get(key)
+            if old == norm:
+                continue
+            if old is not None:
+                keys = self.by_name[old]
+                keys.discard(key)
+                if not keys:
+                    del self.by_name[old]
+                    removed.add(old)
+            self.entries[key] = norm
+            keys = self.by_name.get(norm)
+            if keys is None:
+                keys = self.by_name[norm] = set()
+                if norm in removed:
+                    # Still present in sorted_names and trigrams; just keep it.
+                    removed.discard(norm)
+                else:
+                    added.append(norm)
+                    grams = name_trigrams(norm)
+                    self.gram_counts[norm] = len(grams)
+                    for gram in grams:
+                        self.trigrams.setdefault(gram, set()).add(norm)
+            keys.add(key)
+
+        for norm in removed:
+            del self.gram_counts[norm]
+            for gram in name_trigrams(norm):
+                names = self.trigrams[gram]
+                names.discard(norm)
+                if not names:
+                    del self.trigrams[gram]
+        # Names added and dropped again within this batch never reached sorted_names.
+        stale = removed.difference(added)
+        added = [norm for norm in added if norm not in removed]
+        # A few names are cheaper to splice in than a pass over the whole list.
+        if len(stale) + len(added) <= 64:
+            for norm in stale:
+                del self.sorted_names[bisect.bisect_left(self.sorted_names, norm)]
+            for norm in added:
+                bisect.insort(self.sorted_names, norm)
+        else:
+            if stale:
+                self.sorted_names = [norm for norm in self.sorted_names if norm not in stale]
+            self.sorted_names.extend(added)
+            self.sorted_names.sort()
+
+    def items(self):
+        return [(kind, tag, self.display[(kind, tag)]) for kind, tag in self.entries]
+
+    def _unlink(self, key, norm: str):
+        keys = self.by_name[norm]
+        keys.discard(key)
+        if keys:
+            return
+        del self.by_name[norm]
+        del self.sorted_names[bisect.bisect_left(self.sorted_names, norm)]
+        del self.gram_counts[norm]
+        for gram in name_trigrams(norm):
+            names = self.trigrams[gram]
+            names.discard(norm)
+            if not names:
+                del self.trigrams[gram]
+
+    def search(self, query: str, kind: str = None, limit: int = 10, min_similarity: float = 0.2,
+               fuzzy: bool = True) -> list:
+        """Return up to `limit` (kind, tag, name) matches, best first.
+
+        Exact names rank first, then prefix matches, then (when `fuzzy`) names
+        ranked by trigram similarity (Jaccard) to the query. The trigram pass
+        is skipped when prefix matches alone fill the limit, or the query is
+        too short.
+        """
+        norm = normalize_name(query)
+        if not norm:
+            return []
+        scores = {}
+        prefix_hits = 0
+
+        i = bisect.bisect_left(self.sorted_names, norm)
+        while i < len(self.sorted_names) and self.sorted_names[i].startswith(norm):
+            name = self.sorted_names[i]
+            scores[name] = 3.0 if name == norm else 2.0
+            prefix_hits += sum(1 for key in self.by_name[name] if kind is None or key[0] == kind)
+            if prefix_hits >= limit and name != norm:
+                break
+            i += 1
+
+        if fuzzy and prefix_hits < limit and len(norm) >= 3:
+            query_grams = name_trigrams(norm)
+            # Rarest trigrams pick the candidates; once that would pass the
+            # cap, commoner trigrams only add to names already picked.
+            shared = {}
+            for gram in sorted(query_grams, key=lambda g: len(self.trigrams.get(g, ()))):
+                names = self.trigrams.get(gram)
+                if not names:
+                    continue
+                if len(shared) + len(names) <= TRIGRAM_CANDIDATE_LIMIT:
+                    for name in names:
+                        shared[name] = shared.get(name, 0) + 1
+                elif not shared:
+                    for name in itertools.islice(names, TRIGRAM_CANDIDATE_LIMIT):
+                        shared[name] = 1
+                else:
+                    for name in shared:
+                        if name in names:
+                            shared[name] += 1
+            for name, count in shared.items():
+                if name in scores:
+                    continue
+                similarity = count / (len(query_grams) + self.gram_counts[name] - count)
+                if similarity >= min_similarity:
+                    scores[name] = similarity
+
+        results = []
+        for name in sorted(scores, key=lambda n: (-scores[n], n)):
+            for key in sorted(self.by_name[name]):
+                if kind is None or key[0] == kind:
+                    results.append((key[0], key[1], self.display[key]))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+name_index = NameIndex()
+
+def _clan_names(clan):
+    if clan and clan.get("tag") and clan.get("name"):
+        yield "clan", clan["tag"].replace("#", ""), clan["name"]
+
+def _player_names(players):
+    for player in players or ():
+        if player.get("tag") and player.get("name"):
+            yield "player", player["tag"].replace("#", ""), player["name"]
+
+def response_names(path: str, data: dict):
+    """Yield (kind, tag, name) for the clans and players in an API response."""
+    parts = path.split("/")
+    if len(parts) < 3 or not isinstance(data, dict):
+        return
+    resource, suffix = parts[1], parts[3] if len(parts) > 3 else ""
+    if resource == "players":
+        yield from _player_names([data])
+        yield from _clan_names(data.get("clan"))
+    elif resource == "clans" and suffix == "":
+        yield from _clan_names(data)
+        yield from _player_names(data.get("memberList"))
+    elif resource == "clans" and suffix == "members":
+        yield from _player_names(data.get("items"))
+    elif resource == "clans" and suffix == "currentwar":
+        for side in ("clan", "opponent"):
+            yield from _clan_names(data.get(side))
+            yield from _player_names((data.get(side) or {}).get("members"))
+
+def build_name_index(entries: dict) -> NameIndex:
+    index = NameIndex()
+    index.add_many(item for path, entry in entries.items() for item in response_names(path, entry[2]))
+    return index
+
+def index_response(path: str, data: dict):
+    """Add the clan and player names in an API response to name_index."""
+    for kind, tag, name in response_names(path, data):
+        name_index.add(kind, tag, name)
+
+RESOLVE_CANDIDATE_LIMIT = 10
+
+def resolve_tag(text: str, kind: str, allowed=None):
+    """Turn a tag or a clan/player name into a tag (without #).
+
+    Returns (tag, candidates). Only a tag or a single exact name resolves,
+    since these commands post mails or remove links. Otherwise tag is None
+    and candidates holds the exact and prefix matches, so the caller can ask
+    the user to pick. A leading # always means a tag, and an exact name wins
+    over tag parsing so names made only of tag characters still work. When
+    `allowed` is given, only tags in it are considered.
+    """
+    text = text.strip()
+    if text.startswith("#"):
+        tag = sanitize_tag(text)
+        return (tag if is_valid_tag(tag) else None), []
+
+    norm = normalize_name(text)
+    if allowed is None:
+        matches = name_index.search(text, kind, limit=RESOLVE_CANDIDATE_LIMIT, fuzzy=False)
+    else:
+        matches = [
+            (kind, tag, name_index.display[(kind, tag)])
+            for tag in sorted(allowed)
+            if norm and name_index.entries.get((kind, tag), "").startswith(norm)
+        ]
+
+    exact = [match for match in matches if name_index.entries[(match[0], match[1])] == norm]
+    if len(exact) == 1:
+        return exact[0][1], []
+    if exact:
+        return None, exact
+
+    tag = sanitize_tag(text)
+    if is_valid_tag(tag):
+        return tag, []
+    return None, matches
+
+def format_candidates(candidates: list) -> str:
+    return "\n".join(f"• {name} — `#{tag}`" for _, tag, name in candidates)
+
+# ------------------------------
+# 🧩 Persistent Component Routing
+# ------------------------------
+
+# Components carry a stable custom_id of the form "<prefix>:<name>". Each view
+# class is registered once with bot.add_view and never times out, and its
+# callbacks hand the interaction to the handler for that prefix. Handlers keep
+# no per-message state, so old messages keep working after a restart.
+COMPONENT_HANDLERS = {}
+
+def component_handler(prefix: str):
+    def decorator(func):
+        COMPONENT_HANDLERS[prefix] = func
+        return func
+    return decorator
+
+async def dispatch_component(interaction: discord.Interaction):
+    custom_id = interaction.data.get("custom_id", "")
+    handler = COMPONENT_HANDLERS.get(custom_id.split(":", 1)[0])
+    if handler is None:
+        await interaction.response.send_message("⚠️ This menu is no longer supported.", ephemeral=True)
+        return
+    await handler(interaction, custom_id)
+
+def register_persistent_view(view_cls):
+    """Register one view_cls instance for routing and return a stopped copy to attach to messages.
+
+    discord.py stores every unfinished view it sends under the message id,
+    and views without a timeout are never dropped. A stopped copy carries
+    the same components but is not stored, so interactions fall back to the
+    single registered instance and memory stays flat.
+    """
+    bot.add_view(view_cls())
+    components = view_cls()
+    components.stop()
+    return components
+
+@bot.event
+async def setup_hook():
+    bot.coc_cache_load_task = asyncio.create_task(load_coc_cache())
+    try:
+        # Render stops containers with SIGTERM; close cleanly so the cache is saved.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass
+    coc_cache_save_loop.start()
+    bot.help_view = register_persistent_view(HelpView)
+    rebuild_profile_owners()
+    roster_refresh_loop.start()
+    bot.leaderboard_view = register_persistent_view(LeaderboardView)
+    leaderboard_refresh_loop.start()
+
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    # Same as the default handler, but commands get a context that times its sends.
+    ctx = await bot.get_context(message, cls=TracedContext)
+    await bot.invoke(ctx)
+
 @bot.event
 async def on_ready():
     print(f"✅ Bot is online as {bot.user}")
@@ -131,15 +768,11 @@ async def linkclan(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    encoded_tag = urllib.parse.quote(f"#{tag}")
-    url = f"https://api.clashofclans.com/v1/clans/{encoded_tag}"
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
-
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
+        status, clan_data = await coc_get(clan_path(tag))
+        if status != 200:
             embed = discord.Embed(title="<< Clan Not Found >>",
-                                  description=f"!! Could not find a clan with that tag. Check and try again !!\n\nStatus: {response.status_code} - {response.text}",
+                                  description=f"!! Could not find a clan with that tag. Check and try again !!\n\nStatus: {status} - {clan_data.get('reason', 'unknown')}",
                                   color=discord.Color.red())
             await ctx.send(embed=embed)
             return
@@ -150,11 +783,9 @@ async def linkclan(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    clan_data = response.json()
     clan_name = clan_data.get("name", "Unknown Clan")
 
-    with open(LINK_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(LINK_FILE)
 
     user_id = str(ctx.author.id)
     if user_id not in data:
@@ -168,8 +799,7 @@ async def linkclan(ctx, tag: str):
         return
 
     data[user_id].append(tag)
-    with open(LINK_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_json(LINK_FILE, data)
 
     embed = discord.Embed(title="<< Clan Linked >>",
                           description="++ Successfully linked clan ++",
@@ -231,8 +861,7 @@ async def debugtoken(ctx, tag: str = "2L80RLGJ8"):
 
 # --- UNLINKCLAN ---
 @bot.command()
-async def unlinkclan(ctx, tag: str):
-    tag = tag.upper().replace("#", "")
+async def unlinkclan(ctx, *, tag: str):
     if not os.path.exists(LINK_FILE):
         embed = discord.Embed(title="<< Not Linked >>",
                               description="!! You haven't linked any clan yet !!",
@@ -240,10 +869,17 @@ async def unlinkclan(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    with open(LINK_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(LINK_FILE)
 
     user_id = str(ctx.author.id)
+    resolved, candidates = resolve_tag(tag, "clan", allowed=set(data.get(user_id, [])))
+    if resolved is None and candidates:
+        embed = discord.Embed(title="<< Which Clan? >>",
+                              description=f"!! `{tag.strip()}` is not the exact name of one of your clans. Use the tag or the full name !!\n\n{format_candidates(candidates)}",
+                              color=discord.Color.orange())
+        await ctx.send(embed=embed)
+        return
+    tag = resolved or sanitize_tag(tag)
     if user_id not in data or tag not in data[user_id]:
         embed = discord.Embed(title="<< Not Linked >>",
                               description="!! You haven't linked this clan !!",
@@ -255,8 +891,7 @@ async def unlinkclan(ctx, tag: str):
     if not data[user_id]:
         del data[user_id]
 
-    with open(LINK_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_json(LINK_FILE, data)
 
     embed = discord.Embed(title="<< Clan Unlinked >>",
                           description=f"++ Successfully unlinked clan tag => #{tag} ++",
@@ -267,7 +902,7 @@ async def unlinkclan(ctx, tag: str):
 async def unlinkclan_error(ctx, error):
     if isinstance(error, commands.MissingRequiredArgument):
         embed = discord.Embed(title="<< Missing Argument >>",
-                              description="!! Please provide the clan tag to unlink.\nUsage: !unlinkclan <clan_tag> !!",
+                              description="!! Please provide the clan tag or name to unlink.\nUsage: !unlinkclan <clan_tag or name> !!",
                               color=discord.Color.orange())
         await ctx.send(embed=embed)
 
@@ -281,8 +916,7 @@ async def myclan(ctx):
         await ctx.send(embed=embed)
         return
 
-    with open(LINK_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(LINK_FILE)
 
     tags = data.get(str(ctx.author.id))
     if not tags:
@@ -292,7 +926,6 @@ async def myclan(ctx):
         await ctx.send(embed=embed)
         return
 
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
     embed = discord.Embed(
         title=f"《 Linked Clans for {ctx.author.display_name} 》",
         color=discord.Color.blue()
@@ -302,10 +935,8 @@ async def myclan(ctx):
 
     for tag in tags:
         try:
-            url = f"https://api.clashofclans.com/v1/clans/%23{tag}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                clan_data = response.json()
+            status, clan_data = await coc_get(clan_path(tag))
+            if status == 200:
                 clan_name = clan_data.get("name", "Unknown Clan")
                 clan_tag_display = f"◆ Tag : #{tag}"
             else:
@@ -333,11 +964,9 @@ async def linkprofile(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
-    url = f"https://api.clashofclans.com/v1/players/%23{tag}"
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
+        status, player_data = await coc_get(player_path(tag))
+        if status != 200:
             embed = discord.Embed(title="<< Player Not Found >>",
                                   description="!! Could not find a player with that tag. Check and try again !!",
                                   color=discord.Color.red())
@@ -350,11 +979,9 @@ async def linkprofile(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    player_data = response.json()
     player_name = player_data.get("name", "Unknown Player")
 
-    with open(PROFILE_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(PROFILE_FILE)
 
     user_id = str(ctx.author.id)
     if user_id not in data:
@@ -368,8 +995,9 @@ async def linkprofile(ctx, tag: str):
         return
 
     data[user_id].append(tag)
-    with open(PROFILE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_json(PROFILE_FILE, data)
+    profile_owners.setdefault(tag, set()).add(user_id)
+    update_leaderboards(tag, player_data)
 
     embed = discord.Embed(title="<< Profile Linked >>",
                           description="++ Successfully linked player profile ++",
@@ -388,8 +1016,7 @@ async def linkprofile_error(ctx, error):
 
 # --- UNLINKPROFILE ---
 @bot.command()
-async def unlinkprofile(ctx, tag: str):
-    tag = tag.upper().replace("#", "")
+async def unlinkprofile(ctx, *, tag: str):
     if not os.path.exists(PROFILE_FILE):
         embed = discord.Embed(title="<< Not Linked >>",
                               description="!! You haven't linked any player profiles yet !!",
@@ -397,10 +1024,17 @@ async def unlinkprofile(ctx, tag: str):
         await ctx.send(embed=embed)
         return
 
-    with open(PROFILE_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(PROFILE_FILE)
 
     user_id = str(ctx.author.id)
+    resolved, candidates = resolve_tag(tag, "player", allowed=set(data.get(user_id, [])))
+    if resolved is None and candidates:
+        embed = discord.Embed(title="<< Which Profile? >>",
+                              description=f"!! `{tag.strip()}` is not the exact name of one of your profiles. Use the tag or the full name !!\n\n{format_candidates(candidates)}",
+                              color=discord.Color.orange())
+        await ctx.send(embed=embed)
+        return
+    tag = resolved or sanitize_tag(tag)
     if user_id not in data or tag not in data[user_id]:
         embed = discord.Embed(title="<< Not Linked >>",
                               description="!! You haven't linked this player profile !!",
@@ -412,8 +1046,10 @@ async def unlinkprofile(ctx, tag: str):
     if not data[user_id]:
         del data[user_id]
 
-    with open(PROFILE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+    save_json(PROFILE_FILE, data)
+    unlink_profile_owner(tag, user_id)
+    if tag not in profile_owners:
+        remove_from_leaderboards(tag)
 
     embed = discord.Embed(title="<< Profile Unlinked >>",
                           description=f"++ Successfully unlinked player profile => #{tag} ++",
@@ -424,7 +1060,7 @@ async def unlinkprofile(ctx, tag: str):
 async def unlinkprofile_error(ctx, error):
     if isinstance(error, commands.MissingRequiredArgument):
         embed = discord.Embed(title="<< Missing Argument >>",
-                              description="!! Please provide the player tag to unlink.\nUsage: !unlinkprofile <player_tag> !!",
+                              description="!! Please provide the player tag or name to unlink.\nUsage: !unlinkprofile <player_tag or name> !!",
                               color=discord.Color.orange())
         await ctx.send(embed=embed)
 
@@ -438,8 +1074,7 @@ async def myprofile(ctx):
         await ctx.send(embed=embed)
         return
 
-    with open(PROFILE_FILE, 'r') as f:
-        data = json.load(f)
+    data = load_json(PROFILE_FILE)
 
     tags = data.get(str(ctx.author.id))
     if not tags:
@@ -449,7 +1084,6 @@ async def myprofile(ctx):
         await ctx.send(embed=embed)
         return
 
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
     embed = discord.Embed(
         title=f"《 Linked Player Profiles for {ctx.author.display_name} 》",
         color=discord.Color.blue()
@@ -459,10 +1093,8 @@ async def myprofile(ctx):
 
     for tag in tags:
         try:
-            url = f"https://api.clashofclans.com/v1/players/%23{tag}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                player_data = response.json()
+            status, player_data = await coc_get(player_path(tag))
+            if status == 200:
                 player_name = player_data.get("name", "Unknown Player")
                 tag_display = f"◆ Tag : #{tag}"
             else:
@@ -496,16 +1128,12 @@ async def send_war_message(ctx, war_type: str):
         await ctx.send(embed=embed)
         return
 
-    clan_tag = "2L80RLGJ8"  # Your clan tag WITHOUT #
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
-    war_url = f"https://api.clashofclans.com/v1/clans/%23{clan_tag}/currentwar"
-
-    response = requests.get(war_url, headers=headers)
-    if response.status_code != 200:
+    clan_tag = HOME_CLAN_TAG
+    status, war_data = await coc_get(clan_path(clan_tag, "/currentwar"))
+    if status != 200:
         await ctx.send("❌ Could not fetch current war info. Maybe no war is running?")
         return
 
-    war_data = response.json()
     opponent_clan = war_data.get("opponent")
     if not opponent_clan:
         await ctx.send("⚠️ Opponent clan data not found in current war info.")
@@ -516,7 +1144,7 @@ async def send_war_message(ctx, war_type: str):
 
     # Send role mention at top
     role_mention = "<@&1387690633614987346>"
-    await mail_channel.send(role_mention)
+    await traced_send(mail_channel, role_mention)
 
     separator = "━━━━━━━━━━━━━━━━━━━━━━━━━━"
     clan_name = "Team Legend"
@@ -550,7 +1178,7 @@ async def send_war_message(ctx, war_type: str):
         )
 
     embed = discord.Embed(title=title, description=description, color=discord.Color.dark_blue())
-    await mail_channel.send(embed=embed)
+    await traced_send(mail_channel, embed=embed)
     await ctx.send(f"✅ War {war_type} message sent in {mail_channel.mention}")
 
 
@@ -578,8 +1206,7 @@ async def setmailchannel(ctx, channel: discord.TextChannel = None):
     if channel is None:
         await ctx.send("⚠️ Please mention a valid text channel.\nUsage: `!setmailchannel #channel`")
         return
-    with open(MAIL_CHANNEL_FILE, 'w') as f:
-        json.dump({"channel_id": channel.id}, f)
+    save_json(MAIL_CHANNEL_FILE, {"channel_id": channel.id}, indent=None)
     await ctx.send(f"✅ Mail channel successfully set to {channel.mention}")
 
 
@@ -593,19 +1220,23 @@ def sanitize_tag(tag: str) -> str:
     return tag.upper().replace("#", "").strip()
 
 async def fetch_war_info(clan_tag: str):
-    headers = {"Authorization": f"Bearer {COC_API_TOKEN}"}
-    url = f"https://api.clashofclans.com/v1/clans/%23{clan_tag}/currentwar"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
+    status, war_data = await coc_get(clan_path(clan_tag, "/currentwar"))
+    if status != 200:
         return None
-    return response.json()
+    return war_data
 
 async def send_war_mail_for_tags(ctx, tags: list, war_type: str):
     for raw_tag in tags:
-        clan_tag = sanitize_tag(raw_tag)
+        clan_tag, candidates = resolve_tag(raw_tag, "clan")
 
-        if not is_valid_tag(clan_tag):
-            await ctx.send(f"❌ Invalid tag: `{raw_tag.strip()}`")
+        if clan_tag is None and candidates:
+            embed = discord.Embed(title="<< Which Clan? >>",
+                                  description=f"!! `{raw_tag.strip()}` is not the exact name of one clan. Use the tag or the full name !!\n\n{format_candidates(candidates)}",
+                                  color=discord.Color.orange())
+            await ctx.send(embed=embed)
+            continue
+        if clan_tag is None:
+            await ctx.send(f"❌ Invalid tag or unknown clan name: `{raw_tag.strip()}`")
             continue
 
         war_data = await fetch_war_info(clan_tag)
@@ -694,6 +1325,429 @@ async def lossmail(ctx, *, tags: str = None):
 
 
 
+# ------------------------------
+# 👥 Clan Roster Tracking — join/leave/role changes for tracked clans
+# ------------------------------
+
+ROSTER_REFRESH_MINUTES = 10
+ROSTER_CONCURRENCY = 8
+
+ROLE_NAMES = {
+    "member": "Member",
+    "admin": "Elder",
+    "coLeader": "Co-Leader",
+    "leader": "Leader",
+}
+
+# clan tag -> {player tag: (name, role)}
+clan_rosters = {}
+# clan tag -> the API payload the roster was built from, to skip unchanged refreshes
+roster_sources = {}
+# player tag -> set of Discord user ids (as strings) that linked the profile
+profile_owners = {}
+
+def rebuild_profile_owners():
+    data = load_json(PROFILE_FILE)
+    profile_owners.clear()
+    for user_id, tags in data.items():
+        for tag in tags:
+            profile_owners.setdefault(tag, set()).add(user_id)
+
+def unlink_profile_owner(tag: str, user_id: str):
+    owners = profile_owners.get(tag)
+    if owners is None:
+        return
+    owners.discard(user_id)
+    if not owners:
+        del profile_owners[tag]
+
+def tracked_clan_tags() -> set:
+    data = load_json(LINK_FILE)
+    tags = {HOME_CLAN_TAG}
+    for clan_tags in data.values():
+        tags.update(clan_tags)
+    return tags
+
+def diff_roster(old: dict, new: dict) -> list:
+    """Return (kind, player_tag, name, old_role, new_role) events between two rosters."""
+    events = []
+    for tag in new.keys() - old.keys():
+        name, role = new[tag]
+        events.append(("join", tag, name, None, role))
+    for tag in old.keys() - new.keys():
+        name, role = old[tag]
+        events.append(("leave", tag, name, role, None))
+    for tag in new.keys() & old.keys():
+        if old[tag][1] != new[tag][1]:
+            events.append(("role", tag, new[tag][0], old[tag][1], new[tag][1]))
+    return events
+
+async def refresh_roster(clan_tag: str):
+    """Refresh one clan roster and return its events, or None if the fetch failed.
+
+    A clan seen for the first time only records a baseline and emits nothing.
+    """
+    if ("clan", clan_tag) not in name_index.entries:
+        # /members carries no clan name; fetch the clan once so it is searchable.
+        await coc_get(clan_path(clan_tag))
+    status, data = await coc_get(clan_path(clan_tag, "/members"))
+    if status != 200:
+        return None
+    if data is roster_sources.get(clan_tag):
+        return []
+
+    new = {}
+    for member in data.get("items", []):
+        new[member["tag"].replace("#", "")] = (member.get("name", "Unknown"), member.get("role", "member"))
+
+    old = clan_rosters.get(clan_tag)
+    clan_rosters[clan_tag] = new
+    roster_sources[clan_tag] = data
+    if old is None:
+        return []
+    return diff_roster(old, new)
+
+async def refresh_all_rosters() -> dict:
+    semaphore = asyncio.Semaphore(ROSTER_CONCURRENCY)
+
+    async def refresh(clan_tag):
+        async with semaphore:
+            try:
+                return clan_tag, await refresh_roster(clan_tag)
+            except Exception as e:
+                print(f"⚠️ Roster refresh failed for #{clan_tag}: {e}")
+                return clan_tag, None
+
+    tracked = tracked_clan_tags()
+    # Forget baselines for clans looked up with !!roster or since unlinked, so
+    # tracking them later starts fresh instead of replaying stale changes.
+    for clan_tag in set(clan_rosters) - tracked:
+        clan_rosters.pop(clan_tag, None)
+        roster_sources.pop(clan_tag, None)
+
+    results = await asyncio.gather(*(refresh(tag) for tag in tracked))
+    return {clan_tag: events for clan_tag, events in results if events}
+
+def format_roster_event(event) -> str:
+    kind, tag, name, old_role, new_role = event
+    owners = profile_owners.get(tag)
+    linked = f" — linked to {', '.join(f'<@{uid}>' for uid in sorted(owners))}" if owners else ""
+    if kind == "join":
+        return f"📥 **{name}** `#{tag}` joined{linked}"
+    if kind == "leave":
+        return f"📤 **{name}** `#{tag}` left{linked}"
+    return f"🔁 **{name}** `#{tag}` {ROLE_NAMES.get(old_role, old_role)} ➜ {ROLE_NAMES.get(new_role, new_role)}{linked}"
+
+async def get_roster_channel(bot):
+    try:
+        data = load_json(ROSTER_CHANNEL_FILE)
+        channel_id = data.get("channel_id")
+        if channel_id is None:
+            return None
+        return bot.get_channel(channel_id)
+    except Exception:
+        return None
+
+async def post_roster_events(clan_tag: str, events: list):
+    channel = await get_roster_channel(bot)
+    if channel is None or not events:
+        return
+    description = "\n".join(format_roster_event(event) for event in events)
+    if len(description) > 4000:
+        description = description[:4000] + "\n…"
+    embed = discord.Embed(title=f"《 Roster Update • #{clan_tag} 》",
+                          description=description,
+                          color=discord.Color.teal())
+    await traced_send(channel, embed=embed)
+
+@tasks.loop(minutes=ROSTER_REFRESH_MINUTES)
+async def roster_refresh_loop():
+    changes = await refresh_all_rosters()
+    for clan_tag, events in changes.items():
+        await post_roster_events(clan_tag, events)
+
+@roster_refresh_loop.before_loop
+async def before_roster_refresh():
+    await bot.wait_until_ready()
+
+# --- SETROSTERCHANNEL COMMAND ---
+@bot.command()
+async def setrosterchannel(ctx, channel: discord.TextChannel = None):
+    if not user_is_authorized(ctx):
+        await ctx.send("⛔ You do not have permission to set the roster channel.")
+        return
+    if channel is None:
+        await ctx.send("⚠️ Please mention a valid text channel.\nUsage: `!!setrosterchannel #channel`")
+        return
+    save_json(ROSTER_CHANNEL_FILE, {"channel_id": channel.id}, indent=None)
+    await ctx.send(f"✅ Roster channel successfully set to {channel.mention}")
+
+# --- ROSTER COMMAND ---
+@bot.command()
+async def roster(ctx, tag: str = HOME_CLAN_TAG):
+    tag = sanitize_tag(tag)
+    if not is_valid_tag(tag):
+        embed = discord.Embed(title="<< Invalid Tag >>",
+                              description="!! Please provide a valid clan tag !!",
+                              color=discord.Color.red())
+        await ctx.send(embed=embed)
+        return
+
+    try:
+        events = await refresh_roster(tag)
+    except Exception as e:
+        embed = discord.Embed(title="<< API Error >>",
+                              description=f"!! Failed to connect to Clash of Clans API. Try again later. !!\n\nError: {e}",
+                              color=discord.Color.red())
+        await ctx.send(embed=embed)
+        return
+
+    if events and tag in tracked_clan_tags():
+        await post_roster_events(tag, events)
+
+    members = clan_rosters.get(tag)
+    if events is None or members is None:
+        embed = discord.Embed(title="<< Clan Not Found >>",
+                              description="!! Could not fetch the member list for that clan !!",
+                              color=discord.Color.red())
+        await ctx.send(embed=embed)
+        return
+
+    linked_lines = []
+    unlinked_names = []
+    for player_tag, (name, role) in sorted(members.items(), key=lambda item: item[1][0].lower()):
+        owners = profile_owners.get(player_tag)
+        if owners:
+            mentions = ", ".join(f"<@{uid}>" for uid in sorted(owners))
+            linked_lines.append(f"◈ {name} ({ROLE_NAMES.get(role, role)}) ➜ {mentions}")
+        else:
+            unlinked_names.append(name)
+
+    description = "\n".join(linked_lines) or "❗ No members have linked their profiles yet."
+    if len(description) > 4000:
+        description = description[:4000] + "\n…"
+    embed = discord.Embed(
+        title=f"《 Roster for #{tag} — {len(linked_lines)}/{len(members)} linked 》",
+        description=description,
+        color=discord.Color.blue()
+    )
+    if unlinked_names:
+        value = ", ".join(unlinked_names)
+        if len(value) > 1024:
+            value = value[:1020] + " …"
+        embed.add_field(name="≪ Not Linked ≫", value=value, inline=False)
+    await ctx.send(embed=embed)
+
+
+# ------------------------------
+# 🏅 Server Leaderboards — rankings over all linked player profiles
+# ------------------------------
+
+# command name -> (display title, player API field)
+LEADERBOARD_STATS = {
+    "trophies": ("🏆 Trophies", "trophies"),
+    "warstars": ("⭐ War Stars", "warStars"),
+    "donations": ("🎁 Donations", "donations"),
+    "townhall": ("🏰 Town Hall", "townHallLevel"),
+}
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_REFRESH_MINUTES = 15
+LEADERBOARD_BATCH_SIZE = 100
+LEADERBOARD_CONCURRENCY = 10
+
+leaderboards = {stat: LeaderboardIndex() for stat in LEADERBOARD_STATS}
+# player tag -> last known player name
+leaderboard_names = {}
+
+def update_leaderboards(tag: str, player_data: dict):
+    leaderboard_names[tag] = player_data.get("name", "Unknown Player")
+    for stat, (_, field) in LEADERBOARD_STATS.items():
+        leaderboards[stat].update(tag, player_data.get(field, 0))
+
+def rebuild_leaderboards(players: list):
+    """Replace every leaderboard from (tag, player_data) pairs."""
+    for tag, player_data in players:
+        leaderboard_names[tag] = player_data.get("name", "Unknown Player")
+    for stat, (_, field) in LEADERBOARD_STATS.items():
+        leaderboards[stat].rebuild((tag, player_data.get(field, 0)) for tag, player_data in players)
+
+def remove_from_leaderboards(tag: str):
+    leaderboard_names.pop(tag, None)
+    for index in leaderboards.values():
+        index.remove(tag)
+
+async def refresh_leaderboards():
+    """Refresh every linked profile in batches and drop tags no longer linked."""
+    tags = list(profile_owners)
+    semaphore = asyncio.Semaphore(LEADERBOARD_CONCURRENCY)
+
+    # On a cold start every player is new, so collect them all and sort once.
+    cold = not leaderboard_names
+    fetched = []
+
+    async def refresh(tag):
+        async with semaphore:
+            try:
+                status, player_data = await coc_get(player_path(tag))
+            except Exception as e:
+                print(f"⚠️ Leaderboard refresh failed for #{tag}: {e}")
+                return
+        if status != 200:
+            return
+        if cold:
+            fetched.append((tag, player_data))
+        else:
+            update_leaderboards(tag, player_data)
+
+    for i in range(0, len(tags), LEADERBOARD_BATCH_SIZE):
+        await asyncio.gather(*(refresh(tag) for tag in tags[i:i + LEADERBOARD_BATCH_SIZE]))
+
+    if cold and not leaderboard_names:
+        rebuild_leaderboards(fetched)
+    else:
+        # Something was linked mid-refresh; fall back to incremental updates.
+        for tag, player_data in fetched:
+            update_leaderboards(tag, player_data)
+
+    for tag in [tag for tag in leaderboard_names if tag not in profile_owners]:
+        remove_from_leaderboards(tag)
+
+@tasks.loop(minutes=LEADERBOARD_REFRESH_MINUTES)
+async def leaderboard_refresh_loop():
+    await refresh_leaderboards()
+
+@leaderboard_refresh_loop.before_loop
+async def before_leaderboard_refresh():
+    await bot.wait_until_ready()
+
+def build_leaderboard_embed(stat: str, page: int) -> discord.Embed:
+    title, _ = LEADERBOARD_STATS[stat]
+    index = leaderboards[stat]
+    pages = max(1, -(-len(index) // LEADERBOARD_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * LEADERBOARD_PAGE_SIZE
+
+    lines = []
+    for rank, (tag, value) in enumerate(index.top(start, LEADERBOARD_PAGE_SIZE), start=start + 1):
+        owners = profile_owners.get(tag)
+        mentions = f" — {', '.join(f'<@{uid}>' for uid in sorted(owners))}" if owners else ""
+        lines.append(f"`{rank:>3}.` **{leaderboard_names.get(tag, 'Unknown Player')}** • {value}{mentions}")
+
+    embed = discord.Embed(
+        title=f"《 {title} Leaderboard 》",
+        description="\n".join(lines) or "❗ No linked profiles have been ranked yet.",
+        color=discord.Color.gold()
+    )
+    # The footer is the only state the pagination buttons need.
+    embed.set_footer(text=f"Page {page}/{pages} • {stat}")
+    return embed
+
+@component_handler("lb")
+async def handle_leaderboard_component(interaction: discord.Interaction, custom_id: str):
+    page, stat = 1, "trophies"
+    if interaction.message and interaction.message.embeds:
+        footer = interaction.message.embeds[0].footer.text or ""
+        try:
+            page_part, stat = footer.split(" • ", 1)
+            page = int(page_part.split()[1].split("/")[0])
+        except (ValueError, IndexError):
+            pass
+    if stat not in LEADERBOARD_STATS:
+        stat = "trophies"
+
+    if custom_id == "lb:prev":
+        page -= 1
+    elif custom_id == "lb:next":
+        page += 1
+    await interaction.response.edit_message(embed=build_leaderboard_embed(stat, page))
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary, custom_id="lb:prev")
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await dispatch_component(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary, custom_id="lb:next")
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await dispatch_component(interaction)
+
+# --- LEADERBOARD COMMAND ---
+@bot.command(aliases=["lb"])
+async def leaderboard(ctx, stat: str = "trophies"):
+    stat = stat.lower().replace(" ", "").replace("_", "")
+    if stat not in LEADERBOARD_STATS:
+        embed = discord.Embed(title="<< Unknown Leaderboard >>",
+                              description=f"!! Choose one of: {', '.join(f'`{name}`' for name in LEADERBOARD_STATS)} !!",
+                              color=discord.Color.red())
+        await ctx.send(embed=embed)
+        return
+    await ctx.send(embed=build_leaderboard_embed(stat, 1), view=bot.leaderboard_view)
+
+# --- TRACES COMMAND (owner only) ---
+def format_trace(span) -> str:
+    status = "❌" if span.failed else "✅"
+    guild = bot.get_guild(span.guild_id) if span.guild_id else None
+    where = guild.name if guild else (f"guild {span.guild_id}" if span.guild_id else "DM")
+    return (
+        f"{status} `!!{span.command}` **{span.total_ms:.0f} ms** • <@{span.user_id}> • {where} • <t:{int(span.started_at)}:R>\n"
+        f"  ↳ api {span.api_ms:.0f} ms ({span.api_calls}) • store {span.store_ms:.0f} ms ({span.store_calls}) • "
+        f"discord {span.discord_ms:.0f} ms ({span.discord_calls})"
+    )
+
+@bot.command()
+async def traces(ctx, mode: str = "slow", count: int = 10):
+    if ctx.author.id != BOT_OWNER_ID:
+        await ctx.send("⛔ Only the bot owner can run this command.")
+        return
+    mode = mode.lower()
+    spans = completed_traces()
+
+    if mode == "export":
+        save_json(TRACE_EXPORT_FILE, sorted((span.to_dict() for span in spans), key=lambda t: t["started_at"]))
+        await ctx.send(f"📦 Exported {len(spans)} traces.", file=discord.File(TRACE_EXPORT_FILE))
+        return
+    if mode not in ("slow", "recent"):
+        await ctx.send("⚠️ Usage: `!!traces [slow|recent|export] [count]`")
+        return
+
+    count = min(max(count, 1), 20)
+    key = (lambda span: span.total_ms) if mode == "slow" else (lambda span: span.started_at)
+    selected = sorted(spans, key=key, reverse=True)[:count]
+
+    description = "\n".join(format_trace(span) for span in selected) or "❗ No commands traced yet."
+    if len(description) > 4000:
+        description = description[:4000] + "\n…"
+    embed = discord.Embed(
+        title=f"《 {'Slowest' if mode == 'slow' else 'Most Recent'} Commands 》",
+        description=description,
+        color=discord.Color.dark_grey()
+    )
+    embed.set_footer(text=f"{len(spans)} traces kept • ring size {TRACE_RING_SIZE}")
+    await ctx.send(embed=embed)
+
+
+# --- /findtag SLASH COMMAND ---
+@bot.tree.command(name="findtag", description="Look up clan and player tags by name")
+@app_commands.describe(name="Clan or player name (or part of it)")
+async def findtag(interaction: discord.Interaction, name: str):
+    results = name_index.search(name, limit=10)
+    lines = [f"{'🛡️' if kind == 'clan' else '👤'} **{display}** — `#{tag}`" for kind, tag, display in results]
+    embed = discord.Embed(
+        title=f"《 Tags matching “{name[:50]}” 》",
+        description="\n".join(lines) or "❗ No clan or player with that name has been seen yet.",
+        color=discord.Color.blue()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@findtag.autocomplete("name")
+async def findtag_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=f"{display} (#{tag})"[:100], value=display[:100])
+        for kind, tag, display in name_index.search(current, limit=25)
+    ]
+
 
 # ===== HELP COMMAND PAGES =====
 HELP_PAGES = {
@@ -704,30 +1758,35 @@ HELP_PAGES = {
         "`!!myclan` - Show your linked clans.\n"
         "`!!myprofile` - Show your linked player profiles.\n"
         "`!!linkclan <clan_tag>` - Link your clan.\n"
-        "`!!unlinkclan <clan_tag>` - Unlink your clan.\n"
+        "`!!unlinkclan <clan_tag or name>` - Unlink your clan.\n"
         "`!!linkprofile <player_tag>` - Link your player profile.\n"
-        "`!!unlinkprofile <player_tag>` - Unlink your player profile.\n"
+        "`!!unlinkprofile <player_tag or name>` - Unlink your player profile.\n"
+        "`!!roster [clan_tag]` - Show clan members and who they are linked to.\n"
+        "`!!leaderboard [trophies|warstars|donations|townhall]` - Rank all linked profiles.\n"
     ),
     "War Mail Commands": (
         "⚔️ **War Mail Commands:**\n"
         "━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         "`!!winmail <clan_tag(s)>` - Send WIN war message for any clan.\n"
         "`!!lossmail <clan_tag(s)>` - Send LOSS war message for any clan.\n"
-        "Note: Multiple clan tags separated by commas.\n"
+        "Note: Multiple clan tags separated by commas. Clan names the bot has seen work too.\n"
     ),
     "Clan/Profile Linking": (
         "🔗 **Clan & Profile Linking:**\n"
         "━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         "Link or unlink your Clash of Clans clans and player profiles.\n"
         "Commands: `!!linkclan`, `!!unlinkclan`, `!!linkprofile`, `!!unlinkprofile`.\n"
+        "Don't know a tag? Use `/findtag <name>` to look it up.\n"
     ),
     "Admin Commands": (
         "🛡️ **Admin Commands:**\n"
         "━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         "`!!setmailchannel #channel` - Set channel to send war mails.\n"
+        "`!!setrosterchannel #channel` - Set channel for member join/leave updates.\n"
         "`!!TLwin` - Send Team Legend WIN war message (Admin only).\n"
         "`!!TLloss` - Send Team Legend LOSS war message (Admin only).\n"
         "Only users with admin role or bot owner can run these.\n"
+        "`!!traces [slow|recent|export]` - Inspect slow commands (Bot owner only).\n"
     ),
     "Bot Info": (
         "🤖 **Bot Information:**\n"
@@ -738,24 +1797,38 @@ HELP_PAGES = {
     ),
 }
 
+# Rendered once; every help message and menu selection reuses these.
+HELP_EMBEDS = {
+    page: discord.Embed(title=page, description=content, color=discord.Color.blue())
+    for page, content in HELP_PAGES.items()
+}
+
+@component_handler("help")
+async def handle_help_component(interaction: discord.Interaction, custom_id: str):
+    page = interaction.data.get("values", ["Bot Info"])[0]
+    embed = HELP_EMBEDS.get(page)
+    if embed is None:
+        await interaction.response.send_message("Page not found.", ephemeral=True)
+        return
+    await interaction.response.edit_message(embed=embed)
+
 # ===== HELP SELECT MENU CLASS =====
+HELP_OPTIONS = [
+    discord.SelectOption(label=key, description=f"View commands for {key}") for key in HELP_PAGES.keys()
+]
+
 class HelpSelect(discord.ui.Select):
     def __init__(self):
-        options = [
-            discord.SelectOption(label=key, description=f"View commands for {key}") for key in HELP_PAGES.keys()
-        ]
-        super().__init__(placeholder="Select a help category...", min_values=1, max_values=1, options=options)
+        super().__init__(custom_id="help:select", placeholder="Select a help category...",
+                         min_values=1, max_values=1, options=HELP_OPTIONS)
 
     async def callback(self, interaction: discord.Interaction):
-        page = self.values[0]
-        content = HELP_PAGES.get(page, "Page not found.")
-        embed = discord.Embed(title=page, description=content, color=discord.Color.blue())
-        await interaction.response.edit_message(embed=embed, view=self.view)
+        await dispatch_component(interaction)
 
 # ===== HELP VIEW WITH SELECT MENU =====
 class HelpView(discord.ui.View):
     def __init__(self):
-        super().__init__()
+        super().__init__(timeout=None)
         self.add_item(HelpSelect())
 
 # ===== HELP COMMAND =====
@@ -763,9 +1836,7 @@ class HelpView(discord.ui.View):
 async def help_command(ctx):
     """Show help pages with dropdown menu"""
     # Default page to show initially
-    initial_page = "Bot Info"
-    embed = discord.Embed(title=initial_page, description=HELP_PAGES[initial_page], color=discord.Color.blue())
-    await ctx.send(embed=embed, view=HelpView())
+    await ctx.send(embed=HELP_EMBEDS["Bot Info"], view=bot.help_view)
 
 
 
@@ -780,4 +1851,9 @@ print("🔍 Render server public IP:", ip)
 
 
 # --- RUN BOT ---
-bot.run(BOT_TOKEN)
\ No newline at end of file
+bot.run(BOT_TOKEN)
+# Only overwrite the file once it has been fully loaded; a shutdown during
+# startup would otherwise replace it with the few entries fetched so far.
+load_task = getattr(bot, "coc_cache_load_task", None)
+if load_task is not None and load_task.done() and not load_task.cancelled():
+    save_coc_cache()
\ No newline at end of file
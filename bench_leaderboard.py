@@ -0,0 +1,58 @@
+"""Benchmark LeaderboardIndex on synthetic profiles.
+
+Times a full rebuild, incremental updates and top-N queries for each player
+count given, without a bot token or API access:
+
+    python bench_leaderboard.py 5000 20000
+"""
+import sys
+import time
+
+from leaderboard_index import LeaderboardIndex
+
+# player API fields the bot ranks by
+STAT_FIELDS = ("trophies", "warStars", "donations", "townHallLevel")
+PAGE_SIZE = 10
+UPDATES = 1000
+QUERIES = 1000
+
+
+def fake_players(players: int) -> list:
+    return [
+        (f"BENCH{i}", {"trophies": (i * 7919) % 6000, "warStars": (i * 104729) % 3000,
+                       "donations": (i * 15485863) % 20000, "townHallLevel": 1 + i % 17})
+        for i in range(players)
+    ]
+
+
+def run(players: int):
+    data = fake_players(players)
+    indexes = {field: LeaderboardIndex() for field in STAT_FIELDS}
+
+    started = time.perf_counter()
+    for field, index in indexes.items():
+        index.rebuild((tag, player_data[field]) for tag, player_data in data)
+    rebuild_ms = (time.perf_counter() - started) * 1000
+
+    # A background refresh usually changes only some players.
+    updates = min(players, UPDATES)
+    started = time.perf_counter()
+    for tag, player_data in data[:updates]:
+        for field, index in indexes.items():
+            index.update(tag, player_data[field] + 1)
+    update_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for _ in range(QUERIES):
+        indexes["trophies"].top(0, PAGE_SIZE)
+    query_us = (time.perf_counter() - started) * 1_000_000 / QUERIES
+
+    print(f"{players} players × {len(STAT_FIELDS)} stats: "
+          f"rebuild {rebuild_ms:.1f} ms • "
+          f"{updates} updates {update_ms:.1f} ms • "
+          f"top-{PAGE_SIZE} {query_us:.2f} µs")
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:] or ["5000", "20000"]:
+        run(int(arg))
@@ -0,0 +1,38 @@
+import bisect
+
+
+class LeaderboardIndex:
+    """Player tags ranked by one stat, kept sorted as values change.
+
+    ranking holds (-value, tag) so the best players come first and ties
+    break by tag; top-N queries are a slice.
+    """
+
+    def __init__(self):
+        self.ranking = []
+        self.values = {}
+
+    def __len__(self):
+        return len(self.ranking)
+
+    def update(self, tag: str, value: int):
+        old = self.values.get(tag)
+        if old == value:
+            return
+        if old is not None:
+            del self.ranking[bisect.bisect_left(self.ranking, (-old, tag))]
+        bisect.insort(self.ranking, (-value, tag))
+        self.values[tag] = value
+
+    def rebuild(self, values):
+        """Replace the whole index from (tag, value) pairs, sorting once."""
+        self.values = dict(values)
+        self.ranking = sorted((-value, tag) for tag, value in self.values.items())
+
+    def remove(self, tag: str):
+        old = self.values.pop(tag, None)
+        if old is not None:
+            del self.ranking[bisect.bisect_left(self.ranking, (-old, tag))]
+
+    def top(self, start: int, count: int) -> list:
+        return [(tag, -value) for value, tag in self.ranking[start:start + count]]